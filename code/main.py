@@ -1,12 +1,13 @@
 import os
 
+from datasets import Dataset as HFDataset
 import numpy as np
 import pandas as pd
 from sklearn.metrics import accuracy_score, f1_score
 from sklearn.model_selection import train_test_split
 from tabulate import tabulate
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 from transformers import (
     AutoModelForSequenceClassification,
@@ -22,6 +23,7 @@ from .utils import (
     HF_TEAM_NAME,
     check_dataset,
     config_print,
+    debug_print,
     get_parser,
     load_env_file,
     make_json_report,
@@ -32,37 +34,77 @@ from .utils import (
 )
 
 
+# 배치 토크나이즈 시 rust 토크나이저의 멀티스레딩을 허용
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
+
 class BERTDataset(Dataset):
+    """clean_lab 스크립트 등 DataFrame을 바로 감싸서 쓰는 곳을 위한 in-memory dataset.
+
+    main.py의 학습 경로는 디스크 캐시가 가능한 tokenize_dataset을 사용합니다.
+    """
+
     def __init__(self, data, tokenizer, max_length):
-        input_texts = data["text"]
-        targets = data["target"]
-        self.inputs = []
-        self.labels = []
-        for text, label in zip(input_texts, targets):
-            tokenized_input = tokenizer(
-                text,
-                padding="max_length",
-                truncation=True,
-                max_length=max_length,
-                return_tensors="pt",
-            )
-            self.inputs.append(tokenized_input)
-            self.labels.append(torch.tensor(label))
+        # 행 단위 호출 대신 전체 코퍼스를 한 번에 토크나이즈 (rust 토크나이저가 배치를 병렬 처리함)
+        encodings = tokenizer(
+            list(data["text"]),
+            padding="max_length",
+            truncation=True,
+            max_length=max_length,
+            return_tensors="pt",
+        )
+        self.input_ids = encodings["input_ids"]
+        self.attention_mask = encodings["attention_mask"]
+        self.labels = torch.as_tensor(list(data["target"]), dtype=torch.long)
 
     def __getitem__(self, idx):
         return {
-            "input_ids": self.inputs[idx]["input_ids"].squeeze(0),
-            "attention_mask": self.inputs[idx]["attention_mask"].squeeze(0),
-            "labels": self.labels[idx].squeeze(0),
+            "input_ids": self.input_ids[idx],
+            "attention_mask": self.attention_mask[idx],
+            "labels": self.labels[idx],
         }
 
     def __len__(self):
         return len(self.labels)
 
 
+def tokenize_dataset(df, tokenizer, max_length):
+    """pandas DataFrame을 토크나이즈된 datasets.Dataset으로 변환.
+
+    from_pandas로 만든 in-memory dataset은 map 결과가 자동으로 디스크에 저장되지 않으므로,
+    데이터 내용 해시 + 토크나이저 + max_length로 캐시 파일명을 직접 지정합니다.
+    같은 설정의 두 번째 실행부터는 토크나이즈를 건너뛰고 캐시 파일을 바로 로드합니다.
+    """
+    cache_dir = os.path.join("..", "data", "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    data_hash = pd.util.hash_pandas_object(df, index=False).sum()
+    model_tag = tokenizer.name_or_path.replace("/", "_")
+    cache_file = os.path.join(cache_dir, f"tokenized_{model_tag}_{max_length}_{data_hash:016x}.arrow")
+
+    ds = HFDataset.from_pandas(df, preserve_index=False)
+    ds = ds.map(
+        # padding은 여기서 하지 않고 collator가 배치별 최장 문장 기준으로 수행 (패딩 토큰 연산 낭비 제거)
+        lambda batch: tokenizer(batch["text"], truncation=True, max_length=max_length),
+        batched=True,
+        batch_size=1024,
+        num_proc=4,
+        remove_columns=["text"],
+        cache_file_name=cache_file,
+    )
+    ds = ds.rename_column("target", "labels")
+    ds.set_format("torch", columns=["input_ids", "attention_mask", "labels"])
+    return ds
+
+
 def data_setting(test_size, max_length, SEED, train_path, tokenizer, is_stratify=True):
-    data = pd.read_csv(train_path)
+    # pyarrow 엔진은 CSV를 멀티스레드로 파싱함 (pyarrow는 datasets 의존성으로 이미 설치됨)
+    data = pd.read_csv(train_path, engine="pyarrow")
     data.loc[:, "text"] = data["text"].astype("str")
+
+    # 완전 중복(text+target) 행 제거 — 중복 샘플 수만큼 epoch마다 GPU 연산이 그대로 낭비됨
+    num_rows = len(data)
+    data = data.drop_duplicates(subset=["text", "target"]).reset_index(drop=True)
+    debug_print(f"중복 제거: 전체 {num_rows}개 중 {num_rows - len(data)}개 행이 제거되었습니다.")
     if is_stratify:
         # target 레이블을 기준으로 stratified split 적용
         dataset_train, dataset_valid = train_test_split(
@@ -71,10 +113,11 @@ def data_setting(test_size, max_length, SEED, train_path, tokenizer, is_stratify
     else:
         dataset_train, dataset_valid = train_test_split(data, test_size=test_size, random_state=SEED)
 
-    data_train = BERTDataset(dataset_train, tokenizer, max_length)
-    data_valid = BERTDataset(dataset_valid, tokenizer, max_length)
+    data_train = tokenize_dataset(dataset_train, tokenizer, max_length)
+    data_valid = tokenize_dataset(dataset_valid, tokenizer, max_length)
 
-    data_collator = DataCollatorWithPadding(tokenizer=tokenizer)  # padding이 되어있지 않아도 자동으로 맞춰주는 역할
+    # 배치마다 가장 긴 문장에 맞춰 패딩, 8의 배수 길이로 맞춰 Tensor Core 친화적인 shape 유지
+    data_collator = DataCollatorWithPadding(tokenizer=tokenizer, pad_to_multiple_of=8)
 
     return data_train, data_valid, data_collator
 
@@ -92,29 +135,35 @@ def compute_metrics(eval_pred):
 def compute_metrics_detailed(eval_pred):
     predictions, labels = eval_pred
     predictions = np.argmax(predictions, axis=1)
+    labels = np.asarray(labels)
+
+    # confusion matrix 한 번으로 전체/클래스별 메트릭을 모두 산출
+    # (sklearn 호출마다 전체 배열을 다시 스캔하지 않도록 함)
+    num_classes = int(max(labels.max(), predictions.max())) + 1
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(cm, (labels, predictions), 1)
 
-    # 전체 메트릭
-    accuracy = accuracy_score(labels, predictions)
-    f1_macro = f1_score(labels, predictions, average="macro")
+    tp = cm.diagonal().astype(np.float64)
+    support = cm.sum(axis=1)  # 클래스별 실제 샘플 수
+    predicted = cm.sum(axis=0)  # 클래스별 예측된 샘플 수
 
-    # 클래스별 메트릭
-    f1_per_class = f1_score(labels, predictions, average=None)
-    class_accuracies = {}
-    unique_labels = np.unique(labels)
-    for label in unique_labels:
-        mask = labels == label
-        class_accuracies[f"accuracy_class_{label}"] = accuracy_score(labels[mask], predictions[mask])
+    precision = np.divide(tp, predicted, out=np.zeros(num_classes), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros(num_classes), where=support > 0)
+    denom = precision + recall
+    f1_per_class = np.divide(2 * precision * recall, denom, out=np.zeros(num_classes), where=denom > 0)
 
-    # 전체 메트릭
+    # 전체 메트릭 (macro f1은 등장한 클래스에 대해서만 평균)
+    observed = (support > 0) | (predicted > 0)
     results = {
-        "accuracy": accuracy,
-        "f1": f1_macro,
+        "accuracy": tp.sum() / cm.sum(),
+        "f1": f1_per_class[observed].mean(),
     }
 
-    # 클래스별 메트릭 추가
-    for i, label in enumerate(unique_labels):
-        results[f"f1_class_{label}"] = f1_per_class[i]
-    results.update(class_accuracies)
+    # 클래스별 메트릭 추가 (클래스별 accuracy는 해당 클래스의 recall과 동일)
+    for label in np.flatnonzero(support > 0):
+        results[f"f1_class_{label}"] = f1_per_class[label]
+    for label in np.flatnonzero(support > 0):
+        results[f"accuracy_class_{label}"] = recall[label]
 
     return results
 
@@ -131,6 +180,7 @@ def train(
     data_valid,
     data_collator,
     exp_name,
+    grad_accum_steps=1,
 ):
     # 주의: 베이스라인에서 설정한 파라미터 건들지 말 것.
     training_args = TrainingArguments(
@@ -151,7 +201,21 @@ def train(
         lr_scheduler_type="linear",
         per_device_train_batch_size=train_batch_size,
         per_device_eval_batch_size=eval_batch_size,
+        # K 스텝마다 한 번만 optimizer step/AllReduce 수행 (DDP에서 통신량 1/K로 감소)
+        gradient_accumulation_steps=grad_accum_steps,
         num_train_epochs=2,
+        # mixed precision: Ampere 이상이면 BF16, 그 외 GPU는 FP16 (CPU는 둘 다 비활성화)
+        bf16=torch.cuda.is_available() and torch.cuda.is_bf16_supported(),
+        fp16=torch.cuda.is_available() and not torch.cuda.is_bf16_supported(),
+        # TF32는 Ampere 이상에서만 지원됨 (pre-Ampere에서 True를 주면 TrainingArguments가 에러)
+        tf32=torch.cuda.is_available() and torch.cuda.is_bf16_supported(),
+        # 학습 DataLoader가 입력 파이프라인에서 병목이 되지 않도록 워커/핀메모리 설정
+        dataloader_num_workers=min(8, max(1, os.cpu_count() // 2)),
+        dataloader_pin_memory=True,
+        dataloader_persistent_workers=True,
+        dataloader_prefetch_factor=4,
+        # PyTorch 2.x면 TorchInductor로 모델을 컴파일 (pointwise 연산이 matmul 주변에 fuse됨)
+        torch_compile=hasattr(torch, "compile"),
         load_best_model_at_end=True,
         metric_for_best_model="eval_f1",
         greater_is_better=True,
@@ -180,29 +244,85 @@ def train(
     return model
 
 
+def prefetch_batches(loader, device, pinned_buffers, copy_stream):
+    """배치 N의 forward가 도는 동안 배치 N+1의 H2D 복사를 copy_stream에서 미리 수행.
+
+    (device 배치, 복사 완료 event) 쌍을 yield하며, 사용하는 쪽은 forward 전에
+    event를 기다려야 함. pinned_buffers는 두 세트를 번갈아 사용하므로 배치 N의
+    버퍼는 배치 N+2가 복사되기 전까지 덮어써지지 않음.
+    """
+    prev = None
+    for i, batch in enumerate(loader):
+        buffers = pinned_buffers[i % 2]
+        with torch.cuda.stream(copy_stream):
+            staged = {}
+            for key, value in batch.items():
+                # 2-D 슬라이스는 non-contiguous라 pageable 임시 텐서를 거치게 되므로
+                # (H2D가 사실상 동기화됨) 1-D 버퍼에 평탄화해 복사 후 디바이스에서 reshape
+                buffer = buffers[key][: value.numel()]
+                buffer.copy_(value.reshape(-1))
+                staged[key] = buffer.to(device, non_blocking=True).view(value.shape)
+            copy_done = torch.cuda.Event()
+            copy_done.record(copy_stream)
+        if prev is not None:
+            yield prev
+        prev = (staged, copy_done)
+    if prev is not None:
+        yield prev
+
+
 # 평가
 def evaluating(device, model, tokenizer, eval_batch_size, test_path, output_dir):
     model.eval()
-    preds = []
+    # PyTorch 2.x면 추론 경로도 컴파일 (배치별 길이가 달라지므로 cudagraph 모드는 사용하지 않음)
+    if hasattr(torch, "compile"):
+        model = torch.compile(model)
 
     dataset_test = pd.read_csv(test_path)
 
-    # 배치 단위로 처리
-    for i in tqdm(range(0, len(dataset_test), eval_batch_size), desc="Evaluating"):
-        # 배치 데이터 추출
-        batch_samples = dataset_test.iloc[i : i + eval_batch_size]
-        texts = batch_samples["text"].tolist()
-
-        # 배치 단위로 토크나이징
-        inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True).to(device)
+    # padding 없이 한 번에 토크나이즈 후, collator가 배치마다 가장 긴 문장에 맞춰 패딩
+    encodings = tokenizer(dataset_test["text"].tolist(), truncation=True)
+    features = [
+        {"input_ids": ids, "attention_mask": mask}
+        for ids, mask in zip(encodings["input_ids"], encodings["attention_mask"])
+    ]
+    loader = DataLoader(
+        features,
+        batch_size=eval_batch_size,
+        shuffle=False,
+        num_workers=4,
+        collate_fn=DataCollatorWithPadding(tokenizer, pad_to_multiple_of=8),
+    )
 
-        # 예측
-        with torch.no_grad():
-            logits = model(**inputs).logits
-            pred = torch.argmax(torch.nn.Softmax(dim=1)(logits), dim=1).cpu().numpy()
-            preds.extend(pred)
+    preds = []
+    if device.type == "cuda":
+        max_len = tokenizer.model_max_length
+        # double buffering: 배치 N이 forward 되는 동안 배치 N+1이 다른 버퍼 세트로 복사됨
+        pinned_buffers = [
+            {
+                "input_ids": torch.empty(eval_batch_size * max_len, dtype=torch.long, pin_memory=True),
+                "attention_mask": torch.empty(eval_batch_size * max_len, dtype=torch.long, pin_memory=True),
+            }
+            for _ in range(2)
+        ]
+        copy_stream = torch.cuda.Stream()
+
+        batches = prefetch_batches(loader, device, pinned_buffers, copy_stream)
+        for batch, copy_done in tqdm(batches, total=len(loader), desc="Evaluating"):
+            # 해당 배치의 H2D 복사가 끝난 뒤에 forward 시작 (GPU 스트림 간 동기화, CPU는 기다리지 않음)
+            torch.cuda.current_stream().wait_event(copy_done)
+
+            # 예측 (argmax는 softmax 없이도 동일한 결과)
+            with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16):
+                logits = model(**batch).logits
+            preds.append(logits.argmax(dim=-1).cpu())
+    else:
+        for batch in tqdm(loader, desc="Evaluating"):
+            with torch.inference_mode():
+                logits = model(**batch).logits
+            preds.append(logits.argmax(dim=-1).cpu())
 
-    dataset_test["target"] = preds
+    dataset_test["target"] = torch.cat(preds).numpy()
     dataset_test.to_csv(os.path.join(output_dir, "output.csv"), index=False)
     return dataset_test
 
@@ -232,6 +352,8 @@ if __name__ == "__main__":
     train_batch_size = CFG["train"]["train_batch_size"]
     eval_batch_size = CFG["train"]["eval_batch_size"]
     learning_rate = CFG["train"]["lr"]
+    # 추후 추가한 기능이기 때문에 config에 없음을 고려하여 default값을 부여합니다.
+    grad_accum_steps = CFG["train"].get("grad_accum_steps", 1)
 
     user_name = CFG["exp"]["username"]
     upload_gdrive = CFG["gdrive"]["upload"]
@@ -240,12 +362,30 @@ if __name__ == "__main__":
     wandb_project = CFG["wandb"]["project"]
     wandb_entity = CFG["wandb"]["entity"]
 
+    # torchrun 실행 시 DDP 설정 (단일 프로세스 실행이면 rank 0 하나만 존재)
+    rank = int(os.environ.get("RANK", "0"))
+    local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    is_main_process = rank == 0
+
+    # NCCL communicator가 올바른 GPU에 생기도록 process group 생성 전에 디바이스를 먼저 고정
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+        DEVICE = torch.device("cuda", local_rank)
+    else:
+        DEVICE = torch.device("cpu")
+
+    if world_size > 1:
+        torch.distributed.init_process_group(backend="nccl" if torch.cuda.is_available() else "gloo")
+
     exp_name = wandb_name(train_file_name, learning_rate, train_batch_size, test_size, user_name)
-    wandb.init(
-        project=wandb_project,
-        entity=wandb_entity,
-        name=exp_name,
-    )
+    # wandb 로깅은 rank 0에서만 수행
+    if is_main_process:
+        wandb.init(
+            project=wandb_project,
+            entity=wandb_entity,
+            name=exp_name,
+        )
 
     # HuggingFace API키 및 설정
     load_env_file("../setup/.env")
@@ -255,20 +395,22 @@ if __name__ == "__main__":
 
     config_print(CFG)
 
-    # 로컬에 있는지 체크, 다운로드
-    check_dataset(hf_organization, hf_token, train_file_name)
+    # 로컬에 있는지 체크, 다운로드 (rank 0만 다운로드하고 나머지는 barrier에서 대기)
+    if is_main_process:
+        check_dataset(hf_organization, hf_token, train_file_name)
+    if world_size > 1:
+        torch.distributed.barrier()
 
     # link data
     train_path = os.path.join("..", "data", f"{train_file_name}.csv")
     test_path = os.path.join("..", "data", f"{test_file_name}.csv")
 
-    seed_fix(SEED)
-
-    DEVICE = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    # rank별로 다른 seed를 주어 DataLoader 워커 등의 RNG가 겹치지 않도록 함
+    seed_fix(SEED + rank)
 
     # 모델명 절대 수정하지 말 것.
     model_name = "klue/bert-base"
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
     model = AutoModelForSequenceClassification.from_pretrained(model_name, num_labels=7).to(DEVICE)
 
     data_train, data_valid, data_collator = data_setting(
@@ -286,19 +428,22 @@ if __name__ == "__main__":
         data_valid,
         data_collator,
         exp_name,
+        grad_accum_steps,
     )
 
-    dataset_test = evaluating(DEVICE, trained_model, tokenizer, eval_batch_size, test_path, output_dir)
-
-    # upload output & report to gdrive
-    if upload_gdrive:
-        json_report = make_json_report(dataset_test)
-        upload_report(
-            dataset_name=train_file_name,
-            user_name=user_name,
-            exp_name=exp_name,
-            result_df=dataset_test,
-            result_json=json_report,
-        )
+    # 추론과 결과 업로드는 rank 0에서만 수행
+    if is_main_process:
+        dataset_test = evaluating(DEVICE, trained_model, tokenizer, eval_batch_size, test_path, output_dir)
+
+        # upload output & report to gdrive
+        if upload_gdrive:
+            json_report = make_json_report(dataset_test)
+            upload_report(
+                dataset_name=train_file_name,
+                user_name=user_name,
+                exp_name=exp_name,
+                result_df=dataset_test,
+                result_json=json_report,
+            )
 
-    wandb.finish()
+        wandb.finish()
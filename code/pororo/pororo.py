@@ -8,10 +8,23 @@ from pororo import Pororo
 from tqdm import tqdm
 
 
-def back_translation(text, lang1, lang2, mt):
-    trans_text = mt(text, src=lang1, tgt=lang2)
-    backtrans_text = mt(trans_text, src=lang2, tgt=lang1)
-    return backtrans_text
+def supports_batch_input(mt, lang1, lang2, sample_text):
+    # 설치된 Pororo 빌드가 리스트 입력을 지원하는지 1개짜리 배치로 한 번만 확인
+    # (공식 빌드는 str 입력만 받아 AssertionError 등을 내므로, 그 경우 문장별 경로를 사용)
+    try:
+        result = mt([sample_text], src=lang1, tgt=lang2)
+    except (AssertionError, AttributeError, TypeError):
+        return False
+    # 문자열 하나를 돌려주는 빌드에서 list()로 풀면 글자 단위로 쪼개지므로 결과 형태까지 검증
+    return isinstance(result, list) and len(result) == 1
+
+
+def back_translation(texts, lang1, lang2, mt, batch_input=False):
+    # batch_input이면 여러 문장을 한 번에 넘겨 번역 모델이 배치로 처리하도록 함
+    if batch_input:
+        trans_texts = mt(texts, src=lang1, tgt=lang2)
+        return list(mt(trans_texts, src=lang2, tgt=lang1))
+    return [mt(mt(text, src=lang1, tgt=lang2), src=lang2, tgt=lang1) for text in texts]
 
 
 def apply_back_translation(
@@ -21,14 +34,21 @@ def apply_back_translation(
     proro_lang="multi",
     lang1="ko",
     lang2="en",
+    batch_size=32,
 ):
     df = pd.read_csv(data_path)
 
     mt = Pororo(task=proro_task, lang=proro_lang)
 
-    tqdm.pandas()
+    # 한 문장씩 호출하면 GPU가 짧은 커널 사이에 놀게 되므로 batch_size개씩 묶어서 번역
+    texts = df["text"].tolist()
+    batch_input = len(texts) > 0 and supports_batch_input(mt, lang1, lang2, texts[0])
+    backtrans_texts = []
+    for start in tqdm(range(0, len(texts), batch_size), desc="Back translation"):
+        batch = texts[start : start + batch_size]
+        backtrans_texts.extend(back_translation(batch, lang1=lang1, lang2=lang2, mt=mt, batch_input=batch_input))
 
-    df["back_translation"] = df["text"].progress_apply(lambda x: back_translation(x, lang1=lang1, lang2=lang2, mt=mt))
+    df["back_translation"] = backtrans_texts
 
     df.to_csv(output_path, index=False, encoding="utf-8-sig")
 
@@ -12,6 +12,7 @@ from .upload_dataset_hf import HF_TEAM_NAME
 from .utils import (
     check_dataset,
     config_print,
+    debug_print,
     get_parser,
     load_env_file,
     make_json_report,
@@ -112,8 +112,11 @@ def seed_fix(SEED=456):
     random.seed(SEED)
     np.random.seed(SEED)
     torch.manual_seed(SEED)
-    torch.cuda.manual_seed(SEED)
-    torch.cuda.manual_seed_all(SEED)
+    # CPU 실행 시 불필요한 CUDA context 초기화를 피함 (manual_seed_all이 현재 디바이스 시드도 포함)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed_all(SEED)
+        # 같은 shape의 배치가 반복되면 cudnn autotuner 결과를 재사용
+        torch.backends.cudnn.benchmark = True
 
 
 def get_timestamp():
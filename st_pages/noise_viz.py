@@ -1,6 +1,5 @@
-import re
-
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -9,27 +8,44 @@ low_noise_threshold = 0.05
 norm_noise_threshold = 0.2
 high_noise_threshold = 0.3
 
+noise_pattern = r"[^a-zA-Z0-9\sㄱ-ㅎㅏ-ㅣ가-힣]"
+
 
 # 단순 노이즈 비율 계산 : Context 전체 길이 중 특수문자의 비율
+# st.cache_data가 df 해시 기준으로 메모이즈하므로 위젯 조작에 의한 rerun 시 재계산하지 않음
+@st.cache_data
 def calculate_noise_ratio(df):
-    df["noise_ratio"] = df["text"].apply(
-        lambda x: (len(re.findall(r"[^a-zA-Z0-9\sㄱ-ㅎㅏ-ㅣ가-힣]", x)) / len(x) if len(x) > 0 else 0)
-    )
+    # 행 단위 apply 대신 str.count로 컬럼 전체를 C 레벨에서 한 번에 스캔
+    df = df.copy()
+    lengths = df["text"].str.len()
+    df["noise_ratio"] = df["text"].str.count(noise_pattern) / lengths.replace(0, 1)
     return df
 
 
+# 노이즈 구간별 집계 (전체 구간별 수, 라벨별 구간별 수)
+@st.cache_data
+def aggregate_noise_bins(df):
+    categories = ["low_noise", "norm_noise", "high_noise"]
+    noise_bins = pd.cut(
+        df["noise_ratio"],
+        bins=[-np.inf, low_noise_threshold, norm_noise_threshold, np.inf],
+        labels=categories,
+    )
+    bin_counts = noise_bins.value_counts()
+    noise_data = df.assign(noise_bin=noise_bins).groupby(["target", "noise_bin"]).size().unstack(fill_value=0)
+    return bin_counts, noise_data
+
+
 def show(df):
     st.header("노이즈 분석")
 
     df = calculate_noise_ratio(df)
+    # 불리언 마스크 3회 스캔 대신 pd.cut 한 번으로 세 구간을 동시에 집계
+    bin_counts, noise_data = aggregate_noise_bins(df)
 
     st.header("노이즈 비율에 따른 데이터 수 Bar plot")
-    low_noise = df[df["noise_ratio"] <= low_noise_threshold].shape[0]
-    norm_noise = df[(low_noise_threshold < df["noise_ratio"]) & (df["noise_ratio"] <= norm_noise_threshold)].shape[0]
-    high_noise = df[df["noise_ratio"] > norm_noise_threshold].shape[0]
-
     categories = ["low_noise", "norm_noise", "high_noise"]
-    values = [low_noise, norm_noise, high_noise]
+    values = [bin_counts[category] for category in categories]
     colors = ["blue", "green", "red"]
 
     fig, ax = plt.subplots()
@@ -66,20 +82,6 @@ def show(df):
 
     # 라벨별 노이즈 비율 Bar plot
     st.header("라벨별 노이즈 비율 Bar plot")
-    noise_data = (
-        df.groupby("target")["noise_ratio"]
-        .apply(
-            lambda x: pd.Series(
-                {
-                    "low_noise": (x <= low_noise_threshold).sum(),
-                    "norm_noise": ((low_noise_threshold < x) & (x <= norm_noise_threshold)).sum(),
-                    "high_noise": (x > high_noise_threshold).sum(),
-                }
-            )
-        )
-        .unstack()
-    )
-
     fig, ax = plt.subplots()
     noise_data.plot(kind="bar", ax=ax, color=["blue", "green", "red"])
     ax.set_xlabel("Target")